@@ -1,7 +1,9 @@
 import requests
 import mimetypes
 import argparse
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+from google.cloud import bigquery
 from . import utils
 
 
@@ -14,6 +16,12 @@ def parse_args():
         help='Path to the params.yaml file'
     )
     parser.add_argument('--past-hours', default = 25, type = int)
+    parser.add_argument('--max-workers', default = 32, type = int)
+    parser.add_argument(
+        '--overwrite',
+        action='store_true',
+        help='Re-upload attachments that already exist in the bucket'
+    )
     return parser.parse_args()
 
 
@@ -24,24 +32,53 @@ def main():
     try:
         # Fetch recent attachments from BigQuery
         project_analytics = params['project_analytics']
-        creds_analytics = params['credentials_analytics']
+        # Run the query job in the service account's own project, as before
+        credentials_analytics = params['credentials_analytics']
+        bq_client = utils.get_bigquery_client(
+            credentials_analytics.project_id, credentials_analytics
+        )
+        # Select only the columns transfer_file needs, one row per attachment uri
         query = f"""
-          SELECT *
+          SELECT uri, media_type, mime_type, channel_phone
           FROM `{project_analytics}.prod.res_message_attachments`
           WHERE
             inserted_at >= TIMESTAMP_SUB(CURRENT_TIMESTAMP(), INTERVAL {args.past_hours} HOUR)
             AND direction = 'inbound'
             AND media_type NOT IN ('location', 'sticker')
-          ORDER BY channel_phone
+            AND channel_phone NOT IN UNNEST(@skipped_phones)
+          QUALIFY ROW_NUMBER() OVER (PARTITION BY uri ORDER BY inserted_at DESC) = 1
           """
-        df = utils.run_read_bigquery(query, creds_analytics)
-
-        # Prepare GCS bucket
-        storage_client = utils.get_storage_client(params['project_raw'], params['credentials_raw'])
-        bucket = storage_client.bucket(params['bucket_name'])
+        # Leave out channels explicitly mapped to null in the Turn headers; channels with
+        # no entry at all still reach transfer_file and fail loudly
+        skipped_phones = [
+            phone for phone, headers in params['turn_headers'].items()
+            if headers is None
+        ]
+        query_parameters = [
+            bigquery.ArrayQueryParameter('skipped_phones', 'STRING', skipped_phones)
+        ]
+        rows = utils.run_read_bigquery(query, bq_client, query_parameters).to_pylist()
+        if not rows:
+            return
 
-        # Download each attachment and upload to GCS
-        df.apply(lambda row: utils.transfer_file(row, bucket, params['turn_headers']), axis=1)
+        # Download each attachment and upload it to GCS in parallel; every worker thread
+        # keeps its own Turn session and GCS client so connections stay alive
+        project_raw = params['project_raw']
+        credentials_raw = params['credentials_raw']
+        bucket_name = params['bucket_name']
+        utils.refresh_credentials(credentials_raw)
+        max_workers = min(args.max_workers, len(rows))
+        with ThreadPoolExecutor(max_workers = max_workers) as executor:
+            list(executor.map(
+                lambda row: utils.transfer_file(
+                    row,
+                    utils.get_bucket(project_raw, credentials_raw, bucket_name),
+                    params['turn_headers'],
+                    session = utils.get_http_session(),
+                    overwrite = args.overwrite
+                ),
+                rows
+            ))
 
     except Exception as e:
         # Notify on Slack if running in prod
@@ -1,17 +1,23 @@
 import google
+import google.auth.transport.requests
 import json
 import os
+import tempfile
+import threading
 import time
-import pandas as pd
-import oyaml as yaml
+import yaml
 import slack_sdk
 import mimetypes
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from urllib.parse import urlparse
 from pathlib import Path
 from google.cloud import bigquery, bigquery_storage, storage
 from google.oauth2.service_account import Credentials
 
+_thread_local = threading.local()
+
 
 def get_params(params_path = 'params.yaml', envir = None):
     """
@@ -19,8 +25,10 @@ def get_params(params_path = 'params.yaml', envir = None):
     Returns a dict with credentials, GCS project IDs, bucket_name, turn headers, and Slack config.
     """
     # Load params file
+    # Use the libyaml-backed loader when PyYAML was built with it; dicts keep key order
+    loader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
     with open(params_path) as f:
-        params = yaml.safe_load(f)
+        params = yaml.load(f, Loader=loader)
 
     # Determine environment (dev vs prod) from GitHub Actions or override
     github_ref_name = os.getenv('GITHUB_REF_NAME')
@@ -42,7 +50,7 @@ def get_params(params_path = 'params.yaml', envir = None):
         params['credentials_analytics'] = Credentials.from_service_account_file(analytics_key_path)
 
         turn_headers_path = Path('secrets', params['turn_headers'])
-        params['turn_headers'] = json.load(open(turn_headers_path))
+        params['turn_headers'] = json.loads(turn_headers_path.read_text())
 
         # Slack token from local file
         params['slack_token'] = Path('secrets', 'slack_token.txt').read_text().strip()
@@ -63,9 +71,57 @@ def get_storage_client(project, credentials):
     return storage.Client(project=project, credentials=credentials)
 
 
+def get_bucket(project, credentials, bucket_name):
+    """
+    Return the calling thread's handle on bucket_name. Each worker thread gets its own
+    storage client per (project, bucket_name) so it keeps its own keep-alive connections
+    to GCS.
+    """
+    if not hasattr(_thread_local, 'buckets'):
+        _thread_local.buckets = {}
+    key = (project, bucket_name)
+    if key not in _thread_local.buckets:
+        client = get_storage_client(project, credentials)
+        _thread_local.buckets[key] = client.bucket(bucket_name)
+    return _thread_local.buckets[key]
+
+
+def refresh_credentials(credentials):
+    """
+    Fetch an access token up front so threads sharing the credentials don't each refresh
+    it on their first request.
+    """
+    credentials.refresh(google.auth.transport.requests.Request())
+
+
 def get_bigquery_client(project, credentials):
     return bigquery.Client(project=project, credentials=credentials)
 
+
+def get_http_session():
+    """
+    Return the calling thread's requests Session, creating it on first use. The Session
+    keeps connections to Turn alive across downloads and retries transient failures up
+    to 3 times. Sessions aren't guaranteed to be thread-safe, so each worker thread gets
+    its own, the same as its GCS client (see get_bucket).
+    """
+    session = getattr(_thread_local, 'session', None)
+    if session is not None:
+        return session
+
+    retry = Retry(
+        total=3,
+        backoff_factor=0.3,
+        status_forcelist=[429, 500, 502, 503, 504],
+        raise_on_status=False
+    )
+    adapter = HTTPAdapter(max_retries=retry)
+    session = requests.Session()
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    _thread_local.session = session
+    return session
+
 def derive_filename(uri, mime_type):
     """
     Extract the basename from a URI; if missing an extension, guess from the MIME type.
@@ -79,24 +135,47 @@ def derive_filename(uri, mime_type):
         filename = f"{name}{ext}"
     return filename
 
-def run_read_bigquery(query, credentials, num_tries = 5, wait_secs = 5):
+def run_read_bigquery(
+    query, bq_client, query_parameters = None, num_tries = 5, wait_secs = 5
+):
     """
-    Execute a BigQuery query, retrying on concurrent-update errors.
+    Execute a BigQuery query with an existing client and return the result as an Arrow
+    table, retrying on concurrent-update errors.
     """
-    bq_client = bigquery.Client(credentials = credentials)
+    job_config = bigquery.QueryJobConfig(query_parameters = query_parameters or [])
     for attempt in range(1, num_tries + 1):
       try:
-          df = (bq_client.query(query)  # executes the query
+          table = (bq_client.query(query, job_config = job_config)  # executes the query
              .result()                  # waits for completion
-             .to_dataframe())
-          return df
+             .to_arrow())
+          return table
       except google.api_core.exceptions.BadRequest as e:
           if 'due to concurrent update' in str(e) and attempt < num_tries:
               time.sleep(wait_secs)
           else:
               raise e
 
-def transfer_file(row, bucket, turn_headers):
+def blob_exists(blob):
+    """
+    Check whether a blob is already in the bucket. If the service account can't read
+    object metadata, return False so the attachment is uploaded anyway.
+    """
+    try:
+        return blob.exists()
+    except google.api_core.exceptions.Forbidden:
+        return False
+
+def transfer_file(
+    row, bucket, turn_headers, session = requests, overwrite = False,
+    spool_size = 8 * 1024 * 1024, timeout = (10, 60)
+):
+    """
+    Stream an attachment from Turn to GCS, spilling files larger than spool_size to disk
+    so concurrent workers don't each hold a whole attachment in memory.
+    Attachments already in the bucket are skipped unless overwrite is set. timeout is the
+    (connect, read) timeout for the download, so a stalled connection is retried or raised
+    instead of hanging the worker.
+    """
     uri = row['uri']
     media_type = row['media_type']
     mime_type = row['mime_type']
@@ -106,15 +185,22 @@ def transfer_file(row, bucket, turn_headers):
     if headers is None:
         return
 
-    response = requests.get(uri, headers=headers)
-    if response.status_code == 200:
-        filename = derive_filename(uri, mime_type)
-        destination = f"{media_type}/{filename}"
-        blob = bucket.blob(destination)
-        blob.upload_from_string(
-            response.content,
-            content_type=mimetypes.guess_type(filename)[0] or "application/octet-stream"
-        )
+    filename = derive_filename(uri, mime_type)
+    destination = f"{media_type}/{filename}"
+    blob = bucket.blob(destination)
+    if not overwrite and blob_exists(blob):
+        return
+
+    with session.get(uri, headers=headers, stream=True, timeout=timeout) as response:
+        if response.status_code != 200:
+            return
+        with tempfile.SpooledTemporaryFile(max_size=spool_size) as f:
+            for chunk in response.iter_content(chunk_size=1024 * 1024):
+                f.write(chunk)
+            # Passing the size lets small files go up in a single multipart request
+            size = f.tell()
+            content_type = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+            blob.upload_from_file(f, rewind=True, size=size, content_type=content_type)
 
 def get_slack_message_text(error: Exception):
     text = (